@@ -5,7 +5,7 @@ from enum import Enum
 import httpx
 import os
 import asyncio
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import uuid
 from dotenv import load_dotenv
 
@@ -37,9 +37,13 @@ load_dotenv()
 # Get API keys - if none provided, API key auth is disabled
 API_KEYS = os.getenv("API_KEYS", "").split(",") if os.getenv("API_KEYS") else []
 
+# Upper bound on image variants per /images request, matching the image service
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "8"))
+
 class JobStatus(str, Enum):
     PENDING = "pending"
     GENERATING_IMAGE = "generating_image"
+    IMAGES_READY = "images_ready"
     GENERATING_3D = "generating_3d"
     COMPLETED = "completed"
     FAILED = "failed"
@@ -51,9 +55,31 @@ class GenerationRequest(BaseModel):
     steps: Optional[int] = 8
     scales: Optional[float] = 3.5
     seed: Optional[int] = None
+    crop_to_object: Optional[bool] = False
+    output_size: Optional[int] = None
+    image_format: str = "PNG"
+    compress_level: int = 6
 
-@app.post("/generate")
-async def generate_combined(request: GenerationRequest, authorization: str = Header(None)):
+class ImagesRequest(BaseModel):
+    prompt: str
+    num_images: int = 4
+    height: Optional[int] = 1024
+    width: Optional[int] = 1024
+    steps: Optional[int] = 8
+    scales: Optional[float] = 3.5
+    seeds: Optional[List[int]] = None
+    crop_to_object: Optional[bool] = False
+    output_size: Optional[int] = None
+    image_format: str = "PNG"
+    compress_level: int = 6
+
+class Generate3DRequest(BaseModel):
+    job_id: str
+    image_id: str
+    mesh_simplify: Optional[float] = 0.95
+    texture_size: Optional[int] = 1024
+
+def verify_api_key(authorization: Optional[str]):
     # Verify API key only if API_KEYS is configured
     if API_KEYS:
         if not authorization or not authorization.startswith("Bearer "):
@@ -61,21 +87,145 @@ async def generate_combined(request: GenerationRequest, authorization: str = Hea
         provided_key = authorization.replace("Bearer ", "")
         if provided_key not in API_KEYS:
             raise HTTPException(status_code=401, detail="Invalid API key")
-    
+
+def create_job(prompt: str) -> str:
     job_id = str(uuid.uuid4())
     jobs[job_id] = {
         "status": JobStatus.PENDING,
-        "prompt": request.prompt,
-        "image_path": None,
-        "model_path": None,
+        "prompt": prompt,
+        "images": None,
+        "image_base64": None,
+        "model_base64": None,
         "error": None
     }
+    return job_id
+
+@app.post("/generate")
+async def generate_combined(request: GenerationRequest, authorization: str = Header(None)):
+    verify_api_key(authorization)
+    
+    job_id = create_job(request.prompt)
     
     # Start the generation process in the background
     asyncio.create_task(process_generation(job_id, request))
     
     return {"job_id": job_id, "status": JobStatus.PENDING}
 
+@app.post("/images")
+async def generate_images(request: ImagesRequest, authorization: str = Header(None)):
+    verify_api_key(authorization)
+    
+    if not 1 <= request.num_images <= MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"num_images must be between 1 and {MAX_BATCH_IMAGES}")
+    
+    job_id = create_job(request.prompt)
+    
+    # Only run the image stage; the 3D stage is started by /generate-3d
+    asyncio.create_task(process_images(job_id, request))
+    
+    return {"job_id": job_id, "status": JobStatus.PENDING}
+
+@app.post("/generate-3d")
+async def generate_3d_from_image(request: Generate3DRequest, authorization: str = Header(None)):
+    verify_api_key(authorization)
+    
+    if request.job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job = jobs[request.job_id]
+    if job["status"] not in [JobStatus.IMAGES_READY, JobStatus.COMPLETED, JobStatus.FAILED] or not job["images"]:
+        raise HTTPException(status_code=409, detail=f"Job has no images to select from (status: {job['status']})")
+    
+    selected = next((image for image in job["images"] if image["image_id"] == request.image_id), None)
+    if selected is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    job["image_base64"] = selected["image_base64"]
+    job["model_base64"] = None
+    job["error"] = None
+    job["status"] = JobStatus.GENERATING_3D
+    
+    asyncio.create_task(process_3d(request.job_id, request))
+    
+    return {"job_id": request.job_id, "status": JobStatus.GENERATING_3D}
+
+def runpod_headers():
+    return {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {RUNPOD_API_KEY}"
+    }
+
+async def run_runpod_job(client: httpx.AsyncClient, job_id: str, endpoint_id: str, payload: dict, label: str):
+    headers = runpod_headers()
+    
+    print(f"[{job_id}] Sending {label} request to https://api.runpod.ai/v2/{endpoint_id}/run")
+    response = await client.post(
+        f"https://api.runpod.ai/v2/{endpoint_id}/run",
+        json={"input": payload},
+        headers=headers
+    )
+    
+    if response.status_code != 200:
+        raise HTTPException(status_code=response.status_code, detail=response.text)
+    
+    runpod_job_id = response.json()["id"]
+    print(f"[{job_id}] {label.capitalize()} job created with ID: {runpod_job_id}")
+    
+    # Poll for completion
+    while True:
+        print(f"[{job_id}] Polling {label} status...")
+        status_response = await client.get(
+            f"https://api.runpod.ai/v2/{endpoint_id}/status/{runpod_job_id}",
+            headers=headers
+        )
+        
+        status_data = status_response.json()
+        print(f"[{job_id}] {label.capitalize()} status: {status_data['status']}")
+        
+        if status_data["status"] == "COMPLETED":
+            print(f"[{job_id}] {label.capitalize()} completed successfully")
+            output = status_data["output"]
+            # Streaming workers return every yielded update, the result last
+            if isinstance(output, list):
+                if not output:
+                    raise Exception(f"{label.capitalize()} failed: no output")
+                output = output[-1]
+            # The workers report their own exceptions as an "error" output
+            if "error" in output:
+                raise Exception(f"{label.capitalize()} failed: {output['error']}")
+            return output
+        elif status_data["status"] == "FAILED":
+            print(f"[{job_id}] {label.capitalize()} failed with error: {status_data.get('error', 'Unknown error')}")
+            raise Exception(f"{label.capitalize()} failed: {status_data.get('error', 'Unknown error')}")
+        
+        await asyncio.sleep(2)
+
+async def run_3d_stage(client: httpx.AsyncClient, job_id: str, image_base64: str, mesh_simplify: float = 0.95, texture_size: int = 1024):
+    jobs[job_id]["status"] = JobStatus.GENERATING_3D
+    print(f"[{job_id}] Starting 3D generation with RunPod endpoint: {RUNPOD_3D_ENDPOINT_ID}")
+    
+    model_result = await run_runpod_job(
+        client,
+        job_id,
+        RUNPOD_3D_ENDPOINT_ID,
+        {
+            "image_base64": image_base64,
+            "mesh_simplify": mesh_simplify,
+            "texture_size": texture_size
+        },
+        "3D generation"
+    )
+    
+    jobs[job_id]["model_base64"] = model_result["glb_base64"]
+    jobs[job_id]["status"] = JobStatus.COMPLETED
+    print(f"[{job_id}] Process completed successfully")
+
+def fail_job(job_id: str, e: Exception):
+    print(f"[{job_id}] Process failed with error: {str(e)}")
+    print(e)
+    jobs[job_id]["status"] = JobStatus.FAILED
+    jobs[job_id]["error"] = str(e)
+
 async def process_generation(job_id: str, request: GenerationRequest):
     try:
         print(f"[{job_id}] Starting generation process with prompt: {request.prompt}")
@@ -83,117 +233,82 @@ async def process_generation(job_id: str, request: GenerationRequest):
         print(f"[{job_id}] Status updated to: {JobStatus.GENERATING_IMAGE}")
         
         async with httpx.AsyncClient(timeout=2800.0) as client:
-            print(f"[{job_id}] Sending image generation request to RunPod endpoint: {RUNPOD_IMAGE_ENDPOINT_ID}")
-            
             # Step 1: Generate image
-            print(f"[{job_id}] Sending image generation request to https://api.runpod.ai/v2/{RUNPOD_IMAGE_ENDPOINT_ID}/run")
-            headers = {
-                "Content-Type": "application/json",
-                "Authorization": f"Bearer {RUNPOD_API_KEY}"
-            }
-            
-            # Step 1: Generate image (mostly unchanged)
-            image_response = await client.post(
-                f"https://api.runpod.ai/v2/{RUNPOD_IMAGE_ENDPOINT_ID}/run",
-                json={
-                    "input": {
-                        "prompt": request.prompt,
-                        "height": request.height,
-                        "width": request.width,
-                        "steps": request.steps,
-                        "scales": request.scales,
-                        "seed": request.seed
-                    }
+            image_result = await run_runpod_job(
+                client,
+                job_id,
+                RUNPOD_IMAGE_ENDPOINT_ID,
+                {
+                    "prompt": request.prompt,
+                    "height": request.height,
+                    "width": request.width,
+                    "steps": request.steps,
+                    "scales": request.scales,
+                    "seed": request.seed,
+                    "crop_to_object": request.crop_to_object,
+                    "output_size": request.output_size,
+                    "image_format": request.image_format,
+                    "compress_level": request.compress_level
                 },
-                headers=headers
+                "image generation"
             )
-            
-            if image_response.status_code != 200:
-                raise HTTPException(status_code=image_response.status_code, detail=image_response.text)
-            
-            image_job = image_response.json()
-            image_job_id = image_job["id"]
-            
-            print(f"[{job_id}] Image generation job created with ID: {image_job_id}")
-            
-            # Poll for image completion
-            while True:
-                print(f"[{job_id}] Polling image generation status...")
-                status_response = await client.get(
-                    f"https://api.runpod.ai/v2/{RUNPOD_IMAGE_ENDPOINT_ID}/status/{image_job_id}",
-                    headers=headers
-                )
-                
-                status_data = status_response.json()
-                print(f"[{job_id}] Image status: {status_data['status']}")
-                
-                if status_data["status"] == "COMPLETED":
-                    print(f"[{job_id}] Image generation completed successfully")
-                    image_result = status_data["output"]
-                    break
-                elif status_data["status"] == "FAILED":
-                    print(f"[{job_id}] Image generation failed with error: {status_data.get('error', 'Unknown error')}")
-                    raise Exception(f"Image generation failed: {status_data.get('error', 'Unknown error')}")
-                
-                await asyncio.sleep(2)
 
             image_base64 = image_result["image_base64"]
             jobs[job_id]["image_base64"] = image_base64
 
             # Step 2: Generate 3D model using RunPod
-            jobs[job_id]["status"] = JobStatus.GENERATING_3D
-            print(f"[{job_id}] Starting 3D generation with RunPod endpoint: {RUNPOD_3D_ENDPOINT_ID}")
-            
-            model_response = await client.post(
-                f"https://api.runpod.ai/v2/{RUNPOD_3D_ENDPOINT_ID}/run",
-                json={
-                    "input": {
-                        "image_base64": image_base64,
-                        "mesh_simplify": 0.95,
-                        "texture_size": 1024
-                    }
+            await run_3d_stage(client, job_id, image_base64)
+
+    except Exception as e:
+        fail_job(job_id, e)
+
+async def process_images(job_id: str, request: ImagesRequest):
+    try:
+        print(f"[{job_id}] Generating {request.num_images} image variants with prompt: {request.prompt}")
+        jobs[job_id]["status"] = JobStatus.GENERATING_IMAGE
+        
+        async with httpx.AsyncClient(timeout=2800.0) as client:
+            images_result = await run_runpod_job(
+                client,
+                job_id,
+                RUNPOD_IMAGE_ENDPOINT_ID,
+                {
+                    "prompt": request.prompt,
+                    "num_images": request.num_images,
+                    "height": request.height,
+                    "width": request.width,
+                    "steps": request.steps,
+                    "scales": request.scales,
+                    "seeds": request.seeds,
+                    "crop_to_object": request.crop_to_object,
+                    "output_size": request.output_size,
+                    "image_format": request.image_format,
+                    "compress_level": request.compress_level
                 },
-                headers=headers
+                "image generation"
+            )
+        
+        jobs[job_id]["images"] = images_result["images"]
+        jobs[job_id]["status"] = JobStatus.IMAGES_READY
+        print(f"[{job_id}] {len(images_result['images'])} images ready for selection")
+
+    except Exception as e:
+        fail_job(job_id, e)
+
+async def process_3d(job_id: str, request: Generate3DRequest):
+    try:
+        print(f"[{job_id}] Generating 3D model from image {request.image_id}")
+        async with httpx.AsyncClient(timeout=2800.0) as client:
+            await run_3d_stage(
+                client,
+                job_id,
+                jobs[job_id]["image_base64"],
+                request.mesh_simplify,
+                request.texture_size
             )
-            
-            if model_response.status_code != 200:
-                raise HTTPException(status_code=model_response.status_code, detail=model_response.text)
-            
-            model_job = model_response.json()
-            model_job_id = model_job["id"]
-            
-            print(f"[{job_id}] 3D generation job created with ID: {model_job_id}")
-            
-            # Poll for 3D model completion
-            while True:
-                print(f"[{job_id}] Polling 3D generation status...")
-                status_response = await client.get(
-                    f"https://api.runpod.ai/v2/{RUNPOD_3D_ENDPOINT_ID}/status/{model_job_id}",
-                    headers=headers
-                )
-                
-                status_data = status_response.json()
-                print(f"[{job_id}] 3D model status: {status_data['status']}")
-                
-                if status_data["status"] == "COMPLETED":
-                    print(f"[{job_id}] 3D generation completed successfully")
-                    model_result = status_data["output"]
-                    break
-                elif status_data["status"] == "FAILED":
-                    print(f"[{job_id}] 3D generation failed with error: {status_data.get('error', 'Unknown error')}")
-                    raise Exception(f"3D generation failed: {status_data.get('error', 'Unknown error')}")
-                
-                await asyncio.sleep(2)
-
-            jobs[job_id]["model_base64"] = model_result["glb_base64"]
-            jobs[job_id]["status"] = JobStatus.COMPLETED
-            print(f"[{job_id}] Process completed successfully")
 
     except Exception as e:
-        print(f"[{job_id}] Process failed with error: {str(e)}")
-        print(e)
-        jobs[job_id]["status"] = JobStatus.FAILED
-        jobs[job_id]["error"] = str(e)
+        fail_job(job_id, e)
 
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
@@ -203,6 +318,7 @@ async def get_status(job_id: str):
     job = jobs[job_id]
     return {
         "status": job["status"],
+        "images": job["images"] if job["status"] == JobStatus.IMAGES_READY else None,
         "image_base64": job["image_base64"] if job["status"] in [JobStatus.GENERATING_3D, JobStatus.COMPLETED] else None,
         "model_base64": job["model_base64"] if job["status"] == JobStatus.COMPLETED else None,
         "error": job["error"] if job["status"] == JobStatus.FAILED else None
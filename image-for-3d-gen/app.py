@@ -11,8 +11,9 @@ from transformers import pipeline
 from fastapi import FastAPI, HTTPException
 from fastapi.responses import FileResponse
 from pydantic import BaseModel
-from typing import Optional
+from typing import Optional, List
 from image_generator import ImageGenerator
+from settings import IMAGE_FORMATS, MAX_BATCH_IMAGES
 
 app = FastAPI()
 
@@ -29,9 +30,35 @@ class GenerationRequest(BaseModel):
     steps: Optional[int] = 8
     scales: Optional[float] = 3.5
     seed: Optional[int] = None
+    crop_to_object: Optional[bool] = False
+    output_size: Optional[int] = None
+    image_format: str = "PNG"
+    compress_level: int = 6
+
+class BatchGenerationRequest(BaseModel):
+    prompt: str
+    num_images: int = 4
+    height: Optional[int] = 1024
+    width: Optional[int] = 1024
+    steps: Optional[int] = 8
+    scales: Optional[float] = 3.5
+    seeds: Optional[List[int]] = None
+    crop_to_object: Optional[bool] = False
+    output_size: Optional[int] = None
+    image_format: str = "PNG"
+    compress_level: int = 6
+
+def validate_encoding(request):
+    if request.image_format.upper() not in IMAGE_FORMATS:
+        raise HTTPException(status_code=400, detail=f"image_format must be one of {', '.join(IMAGE_FORMATS)}")
+    if not 0 <= request.compress_level <= 9:
+        raise HTTPException(status_code=400, detail="compress_level must be between 0 and 9")
+    if request.output_size is not None and request.output_size <= 0:
+        raise HTTPException(status_code=400, detail="output_size must be positive")
 
 @app.post("/generate")
 async def generate_image(request: GenerationRequest):
+    validate_encoding(request)
     try:
         result = generator.generate(
             prompt=request.prompt,
@@ -39,7 +66,34 @@ async def generate_image(request: GenerationRequest):
             width=request.width,
             steps=request.steps,
             scales=request.scales,
-            seed=request.seed
+            seed=request.seed,
+            crop_to_object=request.crop_to_object,
+            output_size=request.output_size,
+            image_format=request.image_format,
+            compress_level=request.compress_level
+        )
+        return result
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/images")
+async def generate_images(request: BatchGenerationRequest):
+    if not 1 <= request.num_images <= MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"num_images must be between 1 and {MAX_BATCH_IMAGES}")
+    validate_encoding(request)
+    try:
+        result = generator.generate_batch(
+            prompt=request.prompt,
+            num_images=request.num_images,
+            height=request.height,
+            width=request.width,
+            steps=request.steps,
+            scales=request.scales,
+            seeds=request.seeds,
+            crop_to_object=request.crop_to_object,
+            output_size=request.output_size,
+            image_format=request.image_format,
+            compress_level=request.compress_level
         )
         return result
     except Exception as e:
@@ -1,11 +1,12 @@
 import torch
-from PIL import Image
-import base64
-import io
+import time
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from diffusers import FluxPipeline
 from transformers import pipeline
 from huggingface_hub import hf_hub_download
 import os
+import image_processing
 
 class ImageGenerator:
     def __init__(self):
@@ -29,45 +30,219 @@ class ImageGenerator:
         )
         self.pipe.fuse_lora(lora_scale=0.125)
         self.pipe.to(device="cuda", dtype=torch.bfloat16)
+        
+        # Post-processing and encoding run here, off the inference thread
+        self.encoder = ThreadPoolExecutor(max_workers=int(os.getenv("ENCODER_WORKERS", "4")))
 
     @staticmethod
     def contains_korean(text):
         return any(ord('가') <= ord(c) <= ord('힣') for c in text)
 
-    @staticmethod
-    def image_to_base64(image):
-        buffered = io.BytesIO()
-        image.save(buffered, format="PNG")
-        return base64.b64encode(buffered.getvalue()).decode()
+    image_to_base64 = staticmethod(image_processing.image_to_base64)
+
+    def submit_encode(self, image, **options):
+        return self.encoder.submit(image_processing.postprocess_and_encode, image, **options)
 
-    def generate(self, prompt, height=1024, width=1024, steps=8, scales=3.5, seed=None):
+    def format_prompt(self, prompt):
         # Translate if Korean
         if self.contains_korean(prompt):
             prompt = self.translator(prompt)[0]['translation_text']
         
-        # Format prompt
-        formatted_prompt = f"wbgmsst, 3D, {prompt} ,white background"
-        
-        # Set seed if not provided
-        if seed is None:
-            seed = torch.randint(0, 1000000, (1,)).item()
+        return f"wbgmsst, 3D, {prompt} ,white background"
+
+    @staticmethod
+    def random_seed():
+        return torch.randint(0, 1000000, (1,)).item()
+
+    def _generate_images(self, prompts, seeds, height, width, steps, scales, callback=None):
+        callback_kwargs = {}
+        if callback is not None:
+            # Report progress after each denoising step
+            def on_step_end(pipe, step, timestep, tensors):
+                callback(step + 1, steps)
+                return tensors
+            callback_kwargs["callback_on_step_end"] = on_step_end
         
-        # Generate image
+        # One pipeline call for the whole batch, with a generator per image so
+        # each result is reproducible from its own seed
         with torch.inference_mode(), torch.autocast("cuda", dtype=torch.bfloat16):
-            generated_image = self.pipe(
-                prompt=[formatted_prompt],
-                generator=torch.Generator().manual_seed(seed),
+            return self.pipe(
+                prompt=prompts,
+                generator=[torch.Generator().manual_seed(seed) for seed in seeds],
                 num_inference_steps=steps,
                 guidance_scale=scales,
                 height=height,
                 width=width,
-                max_sequence_length=256
-            ).images[0]
+                max_sequence_length=256,
+                **callback_kwargs
+            ).images
+
+    def _submit_parts(self, parts, height, width, steps, scales, callback=None):
+        # Each part is a (prompts, seeds, encoding options) tuple. All parts share
+        # a single pipeline call. This returns as soon as inference is done, with
+        # a future per part that completes once its images are encoded, so the
+        # caller can start the next inference while encoding runs
+        start = time.perf_counter()
+        generated_images = self._generate_images(
+            [prompt for prompts, _, _ in parts for prompt in prompts],
+            [seed for _, seeds, _ in parts for seed in seeds],
+            height, width, steps, scales, callback
+        )
+        inference_end = time.perf_counter()
+        
+        images = iter(generated_images)
+        return [
+            self._encode_part([next(images) for _ in prompts], options, start, inference_end)
+            for prompts, _, options in parts
+        ]
+
+    def _encode_part(self, images, options, start, inference_end):
+        part_future = Future()
+        image_futures = [self.submit_encode(image, **options) for image in images]
+        remaining = [len(image_futures)]
+        lock = threading.Lock()
         
-        # Convert to base64
-        image_base64 = self.image_to_base64(generated_image)
+        def on_image_done(_):
+            with lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            try:
+                encoded = [future.result() for future in image_futures]
+            except Exception as e:
+                part_future.set_exception(e)
+                return
+            end = time.perf_counter()
+            # Stages are wall-clock times; images are encoded in parallel, so
+            # the per-image times can add up to more than the stage took
+            timings = {
+                "inference": inference_end - start,
+                "postprocess_and_encode": end - inference_end,
+                "total": end - start,
+                "postprocess_per_image": [result["postprocess"] for result in encoded],
+                "encode_per_image": [result["encode"] for result in encoded]
+            }
+            part_future.set_result(([result["image_base64"] for result in encoded], timings))
         
+        for future in image_futures:
+            future.add_done_callback(on_image_done)
+        return part_future
+
+    def _generate_and_encode(self, parts, height, width, steps, scales, callback=None):
+        return [
+            future.result()
+            for future in self._submit_parts(parts, height, width, steps, scales, callback)
+        ]
+
+    def _fill_seeds(self, num_images, seeds=None):
+        # Fill in any seeds that were not provided
+        seeds = list(seeds or [])[:num_images]
+        seeds += [self.random_seed() for _ in range(num_images - len(seeds))]
+        return seeds
+
+    @staticmethod
+    def _image_result(images_base64, seeds, image_format, timings):
         return {
-            "image_base64": image_base64,
-            "seed": seed
-        } 
\ No newline at end of file
+            "image_base64": images_base64[0],
+            "image_format": image_format.upper(),
+            "seed": seeds[0],
+            "timings": timings
+        }
+
+    @staticmethod
+    def _batch_result(images_base64, seeds, image_format, timings):
+        return {
+            "images": [
+                {
+                    "image_id": str(index),
+                    "image_base64": image_base64,
+                    "seed": seed
+                }
+                for index, (image_base64, seed) in enumerate(zip(images_base64, seeds))
+            ],
+            "image_format": image_format.upper(),
+            "timings": timings
+        }
+
+    def generate(self, prompt, height=1024, width=1024, steps=8, scales=3.5, seed=None,
+                 crop_to_object=False, output_size=None, image_format="PNG", compress_level=6, callback=None):
+        formatted_prompt = self.format_prompt(prompt)
+        
+        # Set seed if not provided
+        seeds = self._fill_seeds(1, [seed] if seed is not None else None)
+        
+        # Generate image, then post-process and convert to base64
+        options = {
+            "crop_to_object": crop_to_object,
+            "output_size": output_size,
+            "image_format": image_format,
+            "compress_level": compress_level
+        }
+        [(images_base64, timings)] = self._generate_and_encode(
+            [([formatted_prompt], seeds, options)], height, width, steps, scales, callback
+        )
+        
+        return self._image_result(images_base64, seeds, image_format, timings)
+
+    def generate_batch(self, prompt, num_images=4, height=1024, width=1024, steps=8, scales=3.5, seeds=None,
+                       crop_to_object=False, output_size=None, image_format="PNG", compress_level=6, callback=None):
+        formatted_prompt = self.format_prompt(prompt)
+        seeds = self._fill_seeds(num_images, seeds)
+        
+        # Generate all variants in a single batched call
+        options = {
+            "crop_to_object": crop_to_object,
+            "output_size": output_size,
+            "image_format": image_format,
+            "compress_level": compress_level
+        }
+        [(images_base64, timings)] = self._generate_and_encode(
+            [([formatted_prompt] * num_images, seeds, options)], height, width, steps, scales, callback
+        )
+        
+        return self._batch_result(images_base64, seeds, image_format, timings)
+
+    @staticmethod
+    def _chain(future, make_result, seeds, image_format):
+        # A future for the request result built from a part's encoded images
+        result_future = Future()
+        
+        def on_done(done):
+            try:
+                images_base64, timings = done.result()
+                result_future.set_result(make_result(images_base64, seeds, image_format, timings))
+            except Exception as e:
+                result_future.set_exception(e)
+        
+        future.add_done_callback(on_done)
+        return result_future
+
+    def submit_many(self, requests, height=1024, width=1024, steps=8, scales=3.5):
+        # Runs several requests that share the same pipeline settings in one
+        # batched call. Each request is a dict with a prompt, either a seed or
+        # num_images and seeds, and encoding options. Returns once inference is
+        # done, with a future per request for the same result as generate or
+        # generate_batch respectively
+        parts = []
+        results = []
+        for request in requests:
+            if request.get("num_images") is not None:
+                seeds = self._fill_seeds(request["num_images"], request.get("seeds"))
+                make_result = self._batch_result
+            else:
+                seed = request.get("seed")
+                seeds = self._fill_seeds(1, [seed] if seed is not None else None)
+                make_result = self._image_result
+            options = {
+                "crop_to_object": request.get("crop_to_object", False),
+                "output_size": request.get("output_size"),
+                "image_format": request.get("image_format", "PNG"),
+                "compress_level": request.get("compress_level", 6)
+            }
+            parts.append(([self.format_prompt(request["prompt"])] * len(seeds), seeds, options))
+            results.append((make_result, seeds, options["image_format"]))
+        
+        return [
+            self._chain(future, *result)
+            for future, result in zip(self._submit_parts(parts, height, width, steps, scales), results)
+        ]
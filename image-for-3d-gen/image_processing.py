@@ -0,0 +1,76 @@
+import base64
+import io
+import time
+from PIL import Image, ImageChops
+from settings import IMAGE_FORMATS
+
+# Post-processing and encoding of generated images. Only needs PIL, so it can
+# be used and tested without loading torch or the diffusion pipeline
+
+WHITE = (255, 255, 255)
+
+def image_to_base64(image, image_format="PNG", compress_level=6):
+    image_format = image_format.upper()
+    if image_format not in IMAGE_FORMATS:
+        raise ValueError(f"Unsupported image format: {image_format}")
+    
+    buffered = io.BytesIO()
+    if image_format == "WEBP":
+        # For lossless WebP, quality is the compression effort
+        image.save(buffered, format="WEBP", lossless=True, quality=100)
+    else:
+        image.save(buffered, format="PNG", compress_level=compress_level)
+    return base64.b64encode(buffered.getvalue()).decode()
+
+def crop_around_object(image, tolerance=16, margin=0.1):
+    # Bounding box of everything that differs from the white background
+    image = image.convert("RGB")
+    background = Image.new("RGB", image.size, WHITE)
+    # Use the largest per-channel difference, as luminance would hide
+    # objects that mostly differ in one channel, like pale yellow ones
+    red, green, blue = ImageChops.difference(image, background).split()
+    difference = ImageChops.lighter(ImageChops.lighter(red, green), blue)
+    mask = difference.point(lambda p: 255 if p > tolerance else 0)
+    bbox = mask.getbbox()
+    if bbox is None:
+        return image
+    
+    # Square crop centered on the object, like TRELLIS does before resizing.
+    # Pasting onto a white canvas keeps the background white where the
+    # square extends past the image borders
+    left, top, right, bottom = bbox
+    size = int(max(right - left, bottom - top) * (1 + margin))
+    crop_left = (left + right) // 2 - size // 2
+    crop_top = (top + bottom) // 2 - size // 2
+    cropped = Image.new("RGB", (size, size), WHITE)
+    cropped.paste(image, (-crop_left, -crop_top))
+    return cropped
+
+def pad_to_square(image):
+    # Center the image on a white square, so resizing does not squash it
+    width, height = image.size
+    if width == height:
+        return image
+    size = max(width, height)
+    padded = Image.new("RGB", (size, size), WHITE)
+    padded.paste(image.convert("RGB"), ((size - width) // 2, (size - height) // 2))
+    return padded
+
+def postprocess(image, crop_to_object=False, output_size=None):
+    if crop_to_object:
+        image = crop_around_object(image)
+    if output_size:
+        image = pad_to_square(image).resize((output_size, output_size), Image.LANCZOS)
+    return image
+
+def postprocess_and_encode(image, crop_to_object=False, output_size=None, image_format="PNG", compress_level=6):
+    start = time.perf_counter()
+    image = postprocess(image, crop_to_object, output_size)
+    postprocessed = time.perf_counter()
+    image_base64 = image_to_base64(image, image_format, compress_level)
+    encoded = time.perf_counter()
+    return {
+        "image_base64": image_base64,
+        "postprocess": postprocessed - start,
+        "encode": encoded - postprocessed
+    }
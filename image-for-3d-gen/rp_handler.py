@@ -1,22 +1,264 @@
+import asyncio
+import os
+import queue
+import threading
 import runpod
-from image_generator import ImageGenerator
+from settings import IMAGE_FORMATS, MAX_BATCH_IMAGES
 
-# Initialize generator
-generator = ImageGenerator()
+# How the worker handles events:
+# - "sync": one event at a time, returning the result once it is done
+# - "async": several queued events at once, batched into a single pipeline call
+# - "stream": one event at a time, yielding progress after each denoising step
+HANDLER_MODE = os.getenv("HANDLER_MODE", "sync")
+HANDLER_MODES = ("sync", "async", "stream")
 
-def handler(event):
-    try:
-        input_data = event["input"]
-        return generator.generate(
+# Number of events a worker accepts at the same time in async mode
+MAX_CONCURRENCY = int(os.getenv("MAX_CONCURRENCY", "4"))
+
+# How long to wait for more events to join a batch, in seconds
+BATCH_WINDOW = float(os.getenv("BATCH_WINDOW", "0.05"))
+
+# Initialized on first use, so tests can replace it with a fake generator
+generator = None
+
+def get_generator():
+    global generator
+    if generator is None:
+        from image_generator import ImageGenerator
+        generator = ImageGenerator()
+    return generator
+
+def encoding_options(input_data):
+    return {
+        "crop_to_object": input_data.get("crop_to_object", False),
+        "output_size": input_data.get("output_size"),
+        "image_format": input_data.get("image_format", "PNG"),
+        "compress_level": input_data.get("compress_level", 6)
+    }
+
+def pipeline_settings(input_data):
+    return (
+        input_data.get("height", 1024),
+        input_data.get("width", 1024),
+        input_data.get("steps", 8),
+        input_data.get("scales", 3.5)
+    )
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def validate_input(input_data):
+    # Everything is checked up front, so that a bad request is rejected on its
+    # own instead of failing the batch it would have joined
+    if input_data is None:
+        return "input is required"
+    if not isinstance(input_data, dict):
+        return "input must be an object"
+    if not input_data.get("prompt") or not isinstance(input_data["prompt"], str):
+        return "prompt is required"
+    for name in ("height", "width", "steps"):
+        if name in input_data and not (is_int(input_data[name]) and input_data[name] > 0):
+            return f"{name} must be a positive integer"
+    if "scales" in input_data and not is_number(input_data["scales"]):
+        return "scales must be a number"
+    num_images = input_data.get("num_images")
+    if num_images is not None and not (is_int(num_images) and 1 <= num_images <= MAX_BATCH_IMAGES):
+        return f"num_images must be between 1 and {MAX_BATCH_IMAGES}"
+    seed = input_data.get("seed")
+    if seed is not None and not is_int(seed):
+        return "seed must be an integer"
+    seeds = input_data.get("seeds")
+    if seeds is not None and not (isinstance(seeds, list) and all(is_int(seed) for seed in seeds)):
+        return "seeds must be a list of integers"
+    image_format = input_data.get("image_format", "PNG")
+    if not isinstance(image_format, str) or image_format.upper() not in IMAGE_FORMATS:
+        return f"image_format must be one of {', '.join(IMAGE_FORMATS)}"
+    compress_level = input_data.get("compress_level", 6)
+    if not (is_int(compress_level) and 0 <= compress_level <= 9):
+        return "compress_level must be between 0 and 9"
+    output_size = input_data.get("output_size")
+    if output_size is not None and not (is_int(output_size) and output_size > 0):
+        return "output_size must be a positive integer"
+    return None
+
+def run_input(input_data, callback=None):
+    height, width, steps, scales = pipeline_settings(input_data)
+    if input_data.get("num_images") is not None:
+        return get_generator().generate_batch(
             prompt=input_data.get("prompt"),
-            height=input_data.get("height", 1024),
-            width=input_data.get("width", 1024),
-            steps=input_data.get("steps", 8),
-            scales=input_data.get("scales", 3.5),
-            seed=input_data.get("seed")
+            num_images=input_data.get("num_images"),
+            height=height,
+            width=width,
+            steps=steps,
+            scales=scales,
+            seeds=input_data.get("seeds"),
+            callback=callback,
+            **encoding_options(input_data)
         )
+    return get_generator().generate(
+        prompt=input_data.get("prompt"),
+        height=height,
+        width=width,
+        steps=steps,
+        scales=scales,
+        seed=input_data.get("seed"),
+        callback=callback,
+        **encoding_options(input_data)
+    )
+
+def handler(event):
+    try:
+        input_data = event.get("input")
+        error = validate_input(input_data)
+        if error:
+            return {"error": error}
+        return run_input(input_data)
     except Exception as e:
         return {"error": str(e)}
 
+def stream_handler(event):
+    input_data = event.get("input")
+    error = validate_input(input_data)
+    if error:
+        yield {"error": error}
+        return
+
+    # Inference runs in its own thread, reporting each step through the queue
+    updates = queue.Queue()
+
+    def report_progress(step, total_steps):
+        updates.put(("progress", {"status": "progress", "step": step, "total_steps": total_steps}))
+
+    def run():
+        try:
+            updates.put(("result", run_input(input_data, callback=report_progress)))
+        except Exception as e:
+            updates.put(("result", {"error": str(e)}))
+
+    threading.Thread(target=run, daemon=True).start()
+
+    while True:
+        kind, payload = updates.get()
+        yield payload
+        if kind == "result":
+            return
+
+class Batcher:
+    """Collects concurrent events and runs those with the same pipeline
+    settings in a single batched call."""
+
+    def __init__(self, max_batch_images=MAX_BATCH_IMAGES, batch_window=BATCH_WINDOW):
+        self.max_batch_images = max_batch_images
+        self.batch_window = batch_window
+        self.queue = asyncio.Queue()
+        self.worker = None
+
+    async def submit(self, input_data):
+        if self.worker is None:
+            self.worker = asyncio.create_task(self.run())
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((input_data, future))
+        return await future
+
+    async def run(self):
+        while True:
+            pending = [await self.queue.get()]
+            # Give events that arrive together a chance to share the batch
+            await asyncio.sleep(self.batch_window)
+            while not self.queue.empty():
+                pending.append(self.queue.get_nowait())
+
+            # A failure must not kill the worker, or every later event would hang
+            try:
+                for batch in list(self.make_batches(pending)):
+                    await self.run_batch(batch)
+            except Exception as e:
+                for _, future in pending:
+                    if not future.done():
+                        future.set_result({"error": str(e)})
+
+    def make_batches(self, pending):
+        # Group by pipeline settings, then split groups to fit the GPU
+        groups = {}
+        for item in pending:
+            groups.setdefault(pipeline_settings(item[0]), []).append(item)
+
+        for settings, items in groups.items():
+            batch, batch_images = [], 0
+            for item in items:
+                num_images = item[0].get("num_images") or 1
+                if batch and batch_images + num_images > self.max_batch_images:
+                    yield settings, batch
+                    batch, batch_images = [], 0
+                batch.append(item)
+                batch_images += num_images
+            yield settings, batch
+
+    async def run_batch(self, batch):
+        (height, width, steps, scales), items = batch
+        try:
+            # Returns once inference is done; each event is resolved when its
+            # own images are encoded, while the next batch already runs
+            results = await asyncio.to_thread(
+                get_generator().submit_many,
+                [input_data for input_data, _ in items],
+                height, width, steps, scales
+            )
+        except Exception as e:
+            for _, future in items:
+                if not future.done():
+                    future.set_result({"error": str(e)})
+            return
+
+        for (_, future), result in zip(items, results):
+            asyncio.wrap_future(result).add_done_callback(
+                lambda done, future=future: self.resolve(future, done)
+            )
+
+    @staticmethod
+    def resolve(future, done):
+        if future.done():
+            return
+        if done.exception() is not None:
+            future.set_result({"error": str(done.exception())})
+        else:
+            future.set_result(done.result())
+
+batcher = None
+
+async def async_handler(event):
+    global batcher
+    try:
+        input_data = event.get("input")
+        error = validate_input(input_data)
+        if error:
+            return {"error": error}
+        if batcher is None:
+            batcher = Batcher()
+        return await batcher.submit(input_data)
+    except Exception as e:
+        return {"error": str(e)}
+
+def concurrency_modifier(current_concurrency):
+    return MAX_CONCURRENCY
+
+def serverless_config(mode):
+    # Fail loudly on a typo rather than silently running in another mode
+    if mode == "async":
+        return {"handler": async_handler, "concurrency_modifier": concurrency_modifier}
+    if mode == "stream":
+        return {"handler": stream_handler, "return_aggregate_stream": True}
+    if mode == "sync":
+        return {"handler": handler}
+    raise ValueError(f"Unknown HANDLER_MODE {mode!r}, expected one of {', '.join(HANDLER_MODES)}")
+
 if __name__ == "__main__":
-    runpod.serverless.start({"handler": handler}) 
\ No newline at end of file
+    config = serverless_config(HANDLER_MODE)
+
+    # Load the models before accepting the first event
+    get_generator()
+
+    runpod.serverless.start(config)
@@ -0,0 +1,10 @@
+import os
+
+# Shared by the FastAPI app, the RunPod handler and the image generator.
+# Kept free of heavy imports so the handler can load it without torch
+
+# Output formats the image service can encode to
+IMAGE_FORMATS = ("PNG", "WEBP")
+
+# Upper bound on images per pipeline call, to stay within GPU memory
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "8"))
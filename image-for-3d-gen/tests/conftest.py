@@ -0,0 +1,9 @@
+import os
+import sys
+import types
+
+# The tests run without a GPU: runpod is stubbed, the handler tests swap in a
+# fake generator, and image_processing only needs PIL, so torch and diffusers
+# are never imported
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.modules.setdefault("runpod", types.SimpleNamespace(serverless=types.SimpleNamespace(start=None)))
@@ -0,0 +1,84 @@
+import base64
+import io
+
+import pytest
+
+pytest.importorskip("PIL")
+from PIL import Image, ImageChops, ImageDraw
+
+import image_processing
+
+WHITE = (255, 255, 255)
+PALE_YELLOW = (255, 255, 200)
+
+
+def image_with_box(size, box, color):
+    image = Image.new("RGB", size, WHITE)
+    # box is (left, top, right, bottom), with right and bottom exclusive
+    left, top, right, bottom = box
+    ImageDraw.Draw(image).rectangle((left, top, right - 1, bottom - 1), fill=color)
+    return image
+
+
+def test_crop_finds_pale_objects():
+    image = image_with_box((100, 100), (40, 40, 60, 60), PALE_YELLOW)
+
+    cropped = image_processing.crop_around_object(image)
+
+    # 20px object plus a 10% margin, centered
+    assert cropped.size == (22, 22)
+    assert cropped.getpixel((11, 11)) == PALE_YELLOW
+    assert cropped.getpixel((0, 0)) == WHITE
+    assert cropped.getpixel((1, 1)) == PALE_YELLOW
+
+
+def test_crop_pads_objects_touching_the_border_with_white():
+    image = image_with_box((100, 100), (0, 0, 20, 40), PALE_YELLOW)
+
+    cropped = image_processing.crop_around_object(image)
+
+    # The square is 44px around a 20x40 object centered at (10, 20), so it
+    # extends 12px left of and 2px above the original image
+    assert cropped.size == (44, 44)
+    assert cropped.getpixel((0, 0)) == WHITE
+    assert cropped.getpixel((11, 2)) == WHITE
+    assert cropped.getpixel((12, 2)) == PALE_YELLOW
+    assert cropped.getpixel((31, 41)) == PALE_YELLOW
+    assert cropped.getpixel((32, 41)) == WHITE
+    assert cropped.getpixel((31, 42)) == WHITE
+
+
+def test_crop_leaves_all_white_images_unchanged():
+    image = Image.new("RGB", (64, 32), WHITE)
+
+    cropped = image_processing.crop_around_object(image)
+
+    assert cropped.size == (64, 32)
+    assert ImageChops.difference(cropped, image).getbbox() is None
+
+
+def test_resize_pads_non_square_images_instead_of_squashing_them():
+    image = Image.new("RGB", (200, 100), (255, 0, 0))
+
+    resized = image_processing.postprocess(image, output_size=50)
+
+    assert resized.size == (50, 50)
+    assert resized.getpixel((25, 2)) == WHITE
+    assert resized.getpixel((25, 25)) == (255, 0, 0)
+    assert resized.getpixel((25, 47)) == WHITE
+
+
+@pytest.mark.parametrize("image_format", ["PNG", "WEBP", "webp"])
+def test_encoding_round_trips_losslessly(image_format):
+    image = image_with_box((32, 32), (4, 8, 20, 30), (12, 200, 99))
+
+    encoded = image_processing.image_to_base64(image, image_format, compress_level=9)
+    decoded = Image.open(io.BytesIO(base64.b64decode(encoded)))
+
+    assert decoded.format == image_format.upper()
+    assert ImageChops.difference(decoded.convert("RGB"), image).getbbox() is None
+
+
+def test_encoding_rejects_unsupported_formats():
+    with pytest.raises(ValueError):
+        image_processing.image_to_base64(Image.new("RGB", (4, 4), WHITE), "JPEG")
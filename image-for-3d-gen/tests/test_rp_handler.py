@@ -0,0 +1,139 @@
+import asyncio
+from concurrent.futures import Future
+
+import pytest
+
+import rp_handler
+
+
+class FakeGenerator:
+    """Stands in for ImageGenerator, recording each batched pipeline call."""
+
+    def __init__(self, steps=3):
+        self.steps = steps
+        self.batches = []
+
+    def generate(self, prompt, seed=None, callback=None, **options):
+        for step in range(self.steps):
+            if callback:
+                callback(step + 1, self.steps)
+        return {"image_base64": prompt, "seed": seed}
+
+    def generate_batch(self, prompt, num_images=4, callback=None, **options):
+        return {"images": [{"image_id": str(index), "image_base64": prompt} for index in range(num_images)]}
+
+    def submit_many(self, requests, height, width, steps, scales):
+        self.batches.append(([request["prompt"] for request in requests], (height, width, steps, scales)))
+        futures = []
+        for request in requests:
+            future = Future()
+            # Encoding fails for this prompt only, after the shared GPU call
+            if request["prompt"] == "encode error":
+                future.set_exception(ValueError("encoding failed"))
+            else:
+                future.set_result({"image_base64": request["prompt"]})
+            futures.append(future)
+        return futures
+
+
+@pytest.fixture
+def generator(monkeypatch):
+    fake = FakeGenerator()
+    monkeypatch.setattr(rp_handler, "generator", fake)
+    monkeypatch.setattr(rp_handler, "batcher", None)
+    return fake
+
+
+def run_async(inputs):
+    async def run():
+        return await asyncio.gather(*[rp_handler.async_handler({"input": input_data}) for input_data in inputs])
+    return asyncio.run(run())
+
+
+def test_async_handler_batches_events_with_the_same_settings(generator):
+    results = run_async([
+        {"prompt": "a"},
+        {"prompt": "b", "num_images": 2},
+        {"prompt": "c", "steps": 4},
+        {"prompt": "d"},
+    ])
+
+    assert [result["image_base64"] for result in results] == ["a", "b", "c", "d"]
+    assert sorted(generator.batches) == sorted([
+        (["a", "b", "d"], (1024, 1024, 8, 3.5)),
+        (["c"], (1024, 1024, 4, 3.5)),
+    ])
+
+
+def test_async_handler_splits_batches_above_the_image_limit(generator):
+    run_async([{"prompt": str(index), "num_images": 3} for index in range(3)])
+
+    assert [prompts for prompts, _ in generator.batches] == [["0", "1"], ["2"]]
+
+
+def test_async_handler_rejects_invalid_events_on_their_own(generator):
+    results = run_async([
+        {"prompt": "a"},
+        {"prompt": "b", "compress_level": 42},
+        {"prompt": "c", "height": [1]},
+        {"prompt": "d", "seeds": ["x"]},
+    ])
+
+    assert results[0] == {"image_base64": "a"}
+    assert results[1] == {"error": "compress_level must be between 0 and 9"}
+    assert results[2] == {"error": "height must be a positive integer"}
+    assert results[3] == {"error": "seeds must be a list of integers"}
+    assert [prompts for prompts, _ in generator.batches] == [["a"]]
+
+
+def test_async_handler_isolates_encoding_errors(generator):
+    results = run_async([{"prompt": "a"}, {"prompt": "encode error"}, {"prompt": "b"}])
+
+    assert results == [{"image_base64": "a"}, {"error": "encoding failed"}, {"image_base64": "b"}]
+
+
+def test_batcher_keeps_running_after_a_failure(generator):
+    async def run():
+        batcher = rp_handler.Batcher()
+        # Skips validation, so grouping by the unhashable height fails
+        failed = await batcher.submit({"prompt": "a", "height": [1]})
+        succeeded = await batcher.submit({"prompt": "b"})
+        return failed, succeeded
+
+    failed, succeeded = asyncio.run(run())
+
+    assert "error" in failed
+    assert succeeded == {"image_base64": "b"}
+
+
+def test_stream_handler_yields_progress_then_result(generator):
+    updates = list(rp_handler.stream_handler({"input": {"prompt": "a", "seed": 1}}))
+
+    assert updates == [
+        {"status": "progress", "step": 1, "total_steps": 3},
+        {"status": "progress", "step": 2, "total_steps": 3},
+        {"status": "progress", "step": 3, "total_steps": 3},
+        {"image_base64": "a", "seed": 1},
+    ]
+
+
+def test_stream_handler_yields_an_error_for_malformed_events(generator):
+    assert list(rp_handler.stream_handler({})) == [{"error": "input is required"}]
+    assert list(rp_handler.stream_handler({"input": {"prompt": ""}})) == [{"error": "prompt is required"}]
+
+
+def test_handler_validates_input(generator):
+    assert rp_handler.handler({}) == {"error": "input is required"}
+    assert rp_handler.handler({"input": {"prompt": "a", "image_format": None}}) == {"error": "image_format must be one of PNG, WEBP"}
+    assert rp_handler.handler({"input": {"prompt": "a", "seed": 2}}) == {"image_base64": "a", "seed": 2}
+
+
+def test_serverless_config_picks_the_handler_for_each_mode():
+    assert rp_handler.serverless_config("sync")["handler"] is rp_handler.handler
+    assert rp_handler.serverless_config("async")["handler"] is rp_handler.async_handler
+    assert rp_handler.serverless_config("stream")["handler"] is rp_handler.stream_handler
+
+
+def test_serverless_config_rejects_unknown_modes():
+    with pytest.raises(ValueError, match="asynch"):
+        rp_handler.serverless_config("asynch")
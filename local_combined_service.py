@@ -4,7 +4,7 @@ from pydantic import BaseModel
 from enum import Enum
 import httpx
 import os
-from typing import Optional, Dict
+from typing import Optional, Dict, List
 import uuid
 from dotenv import load_dotenv
 
@@ -14,6 +14,9 @@ load_dotenv()
 # Get API keys - if none provided, API key auth is disabled
 API_KEYS = os.getenv("API_KEYS", "").split(",") if os.getenv("API_KEYS") else []
 
+# Upper bound on image variants per /images request, matching the image service
+MAX_BATCH_IMAGES = int(os.getenv("MAX_BATCH_IMAGES", "8"))
+
 app = FastAPI()
 
 # Add CORS middleware
@@ -35,6 +38,7 @@ jobs: Dict[str, dict] = {}
 class JobStatus(str, Enum):
     PENDING = "pending"
     GENERATING_IMAGE = "generating_image"
+    IMAGES_READY = "images_ready"
     GENERATING_3D = "generating_3d"
     COMPLETED = "completed"
     FAILED = "failed"
@@ -46,9 +50,31 @@ class GenerationRequest(BaseModel):
     steps: Optional[int] = 8
     scales: Optional[float] = 3.5
     seed: Optional[int] = None
+    crop_to_object: Optional[bool] = False
+    output_size: Optional[int] = None
+    image_format: str = "PNG"
+    compress_level: int = 6
 
-@app.post("/generate")
-async def generate_combined(request: GenerationRequest, authorization: str = Header(None)):
+class ImagesRequest(BaseModel):
+    prompt: str
+    num_images: int = 4
+    height: Optional[int] = 1024
+    width: Optional[int] = 1024
+    steps: Optional[int] = 8
+    scales: Optional[float] = 3.5
+    seeds: Optional[List[int]] = None
+    crop_to_object: Optional[bool] = False
+    output_size: Optional[int] = None
+    image_format: str = "PNG"
+    compress_level: int = 6
+
+class Generate3DRequest(BaseModel):
+    job_id: str
+    image_id: str
+    mesh_simplify: Optional[float] = 0.95
+    texture_size: Optional[int] = 1024
+
+def verify_api_key(authorization: Optional[str]):
     # Verify API key only if API_KEYS is configured
     if API_KEYS:
         if not authorization or not authorization.startswith("Bearer "):
@@ -56,15 +82,62 @@ async def generate_combined(request: GenerationRequest, authorization: str = Hea
         provided_key = authorization.replace("Bearer ", "")
         if provided_key not in API_KEYS:
             raise HTTPException(status_code=401, detail="Invalid API key")
-    
+
+def create_job(prompt: str) -> str:
     job_id = str(uuid.uuid4())
     jobs[job_id] = {
         "status": JobStatus.PENDING,
-        "prompt": request.prompt,
+        "prompt": prompt,
+        "images": None,
         "image_base64": None,
         "model_base64": None,
         "error": None
     }
+    return job_id
+
+def job_response(job_id: str):
+    job = jobs[job_id]
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "images": job["images"] if job["status"] == JobStatus.IMAGES_READY else None,
+        "image_base64": job["image_base64"],
+        "model_base64": job["model_base64"],
+        "error": job["error"]
+    }
+
+async def run_3d_stage(client: httpx.AsyncClient, job_id: str, image_base64: str, mesh_simplify: float = 0.95, texture_size: int = 1024):
+    jobs[job_id]["status"] = JobStatus.GENERATING_3D
+    print(f"[{job_id}] Generating 3D model...")
+    
+    model_response = await client.post(
+        f"{MODEL_SERVICE_URL}/process-image",
+        json={
+            "image_base64": image_base64,
+            "mesh_simplify": mesh_simplify,
+            "texture_size": texture_size
+        }
+    )
+    
+    if model_response.status_code != 200:
+        raise HTTPException(status_code=model_response.status_code, 
+                         detail=model_response.text)
+    
+    model_result = model_response.json()
+    jobs[job_id]["model_base64"] = model_result["glb_base64"]
+    jobs[job_id]["status"] = JobStatus.COMPLETED
+    print(f"[{job_id}] Process completed successfully")
+
+def fail_job(job_id: str, e: Exception):
+    print(f"[{job_id}] Process failed with error: {str(e)}")
+    jobs[job_id]["status"] = JobStatus.FAILED
+    jobs[job_id]["error"] = str(e)
+
+@app.post("/generate")
+async def generate_combined(request: GenerationRequest, authorization: str = Header(None)):
+    verify_api_key(authorization)
+    
+    job_id = create_job(request.prompt)
     
     try:
         print(f"[{job_id}] Starting generation process with prompt: {request.prompt}")
@@ -82,7 +155,11 @@ async def generate_combined(request: GenerationRequest, authorization: str = Hea
                     "width": request.width,
                     "steps": request.steps,
                     "scales": request.scales,
-                    "seed": request.seed
+                    "seed": request.seed,
+                    "crop_to_object": request.crop_to_object,
+                    "output_size": request.output_size,
+                    "image_format": request.image_format,
+                    "compress_level": request.compress_level
                 }
             )
 
@@ -97,40 +174,97 @@ async def generate_combined(request: GenerationRequest, authorization: str = Hea
             jobs[job_id]["image_base64"] = image_base64
 
             # Step 2: Generate 3D model
-            jobs[job_id]["status"] = JobStatus.GENERATING_3D
-            print(f"[{job_id}] Generating 3D model...")
+            await run_3d_stage(client, job_id, image_base64)
+
+    except Exception as e:
+        fail_job(job_id, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return job_response(job_id)
+
+@app.post("/images")
+async def generate_images(request: ImagesRequest, authorization: str = Header(None)):
+    verify_api_key(authorization)
+    
+    if not 1 <= request.num_images <= MAX_BATCH_IMAGES:
+        raise HTTPException(status_code=400, detail=f"num_images must be between 1 and {MAX_BATCH_IMAGES}")
+    
+    job_id = create_job(request.prompt)
+    
+    try:
+        print(f"[{job_id}] Generating {request.num_images} image variants with prompt: {request.prompt}")
+        
+        async with httpx.AsyncClient(timeout=1800.0) as client:
+            jobs[job_id]["status"] = JobStatus.GENERATING_IMAGE
             
-            model_response = await client.post(
-                f"{MODEL_SERVICE_URL}/process-image",
+            images_response = await client.post(
+                f"{IMAGE_SERVICE_URL}/images",
                 json={
-                    "image_base64": image_base64,
-                    "mesh_simplify": 0.95,
-                    "texture_size": 1024
+                    "prompt": request.prompt,
+                    "num_images": request.num_images,
+                    "height": request.height,
+                    "width": request.width,
+                    "steps": request.steps,
+                    "scales": request.scales,
+                    "seeds": request.seeds,
+                    "crop_to_object": request.crop_to_object,
+                    "output_size": request.output_size,
+                    "image_format": request.image_format,
+                    "compress_level": request.compress_level
                 }
             )
             
-            if model_response.status_code != 200:
-                raise HTTPException(status_code=model_response.status_code, 
-                                 detail=model_response.text)
+            if images_response.status_code != 200:
+                raise HTTPException(status_code=images_response.status_code, 
+                                 detail=images_response.text)
             
-            model_result = model_response.json()
-            jobs[job_id]["model_base64"] = model_result["glb_base64"]
-            jobs[job_id]["status"] = JobStatus.COMPLETED
-            print(f"[{job_id}] Process completed successfully")
+            jobs[job_id]["images"] = images_response.json()["images"]
+            jobs[job_id]["status"] = JobStatus.IMAGES_READY
+            print(f"[{job_id}] {len(jobs[job_id]['images'])} images ready for selection")
 
     except Exception as e:
-        print(f"[{job_id}] Process failed with error: {str(e)}")
-        jobs[job_id]["status"] = JobStatus.FAILED
-        jobs[job_id]["error"] = str(e)
+        fail_job(job_id, e)
         raise HTTPException(status_code=500, detail=str(e))
 
-    return {
-        "job_id": job_id,
-        "status": jobs[job_id]["status"],
-        "image_base64": jobs[job_id]["image_base64"],
-        "model_base64": jobs[job_id]["model_base64"],
-        "error": jobs[job_id]["error"]
-    }
+    return job_response(job_id)
+
+@app.post("/generate-3d")
+async def generate_3d_from_image(request: Generate3DRequest, authorization: str = Header(None)):
+    verify_api_key(authorization)
+    
+    if request.job_id not in jobs:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    job_id = request.job_id
+    job = jobs[job_id]
+    if job["status"] not in [JobStatus.IMAGES_READY, JobStatus.COMPLETED, JobStatus.FAILED] or not job["images"]:
+        raise HTTPException(status_code=409, detail=f"Job has no images to select from (status: {job['status']})")
+    
+    selected = next((image for image in job["images"] if image["image_id"] == request.image_id), None)
+    if selected is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+    
+    job["image_base64"] = selected["image_base64"]
+    job["model_base64"] = None
+    job["error"] = None
+    
+    try:
+        print(f"[{job_id}] Generating 3D model from image {request.image_id}")
+        
+        async with httpx.AsyncClient(timeout=1800.0) as client:
+            await run_3d_stage(
+                client,
+                job_id,
+                selected["image_base64"],
+                request.mesh_simplify,
+                request.texture_size
+            )
+
+    except Exception as e:
+        fail_job(job_id, e)
+        raise HTTPException(status_code=500, detail=str(e))
+
+    return job_response(job_id)
 
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
@@ -140,6 +274,7 @@ async def get_status(job_id: str):
     job = jobs[job_id]
     return {
         "status": job["status"],
+        "images": job["images"] if job["status"] == JobStatus.IMAGES_READY else None,
         "image_base64": job["image_base64"],
         "model_base64": job["model_base64"],
         "error": job["error"]
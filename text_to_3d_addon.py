@@ -9,15 +9,85 @@ bl_info = {
 }
 
 import bpy
+import bpy.utils.previews
 import requests
 import json
 import os
 import tempfile
-from bpy.props import StringProperty, BoolProperty, FloatProperty, IntProperty
+from bpy.props import StringProperty, BoolProperty, FloatProperty, IntProperty, EnumProperty
 import threading
 import time
 import base64
 
+# Thumbnails of the image variants of the current preview job
+preview_collections = {}
+
+def get_preview_items(self, context):
+    pcoll = preview_collections.get("main")
+    return pcoll.enum_items if pcoll else []
+
+def clear_previews():
+    pcoll = preview_collections.get("main")
+    if pcoll:
+        pcoll.clear()
+        pcoll.enum_items = []
+        # Blender reads the files again for each preview size, so they are
+        # only removed once the previews are gone
+        for path in pcoll.temp_files:
+            if os.path.exists(path):
+                os.unlink(path)
+        pcoll.temp_files = []
+
+def load_previews(images):
+    # Must run in the main thread, as it touches Blender data
+    pcoll = preview_collections["main"]
+    clear_previews()
+    enum_items = []
+    for index, image in enumerate(images):
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".png")
+        temp_file.write(base64.b64decode(image["image_base64"]))
+        temp_file.close()
+        pcoll.temp_files.append(temp_file.name)
+        thumb = pcoll.load(image["image_id"], temp_file.name, 'IMAGE')
+        enum_items.append((image["image_id"], f"Seed {image['seed']}", f"Seed {image['seed']}", thumb.icon_id, index))
+    pcoll.enum_items = enum_items
+
+def import_model(props, model_base64):
+    # Decode base64 and save to temporary file
+    model_data = base64.b64decode(model_base64)
+    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".glb")
+    temp_file.write(model_data)
+    temp_file.close()
+    
+    # Import the GLB file in the main thread
+    def import_handler():
+        bpy.ops.import_scene.gltf(filepath=temp_file.name)
+        os.unlink(temp_file.name)
+        props.is_processing = False
+        return None
+    
+    bpy.app.timers.register(import_handler)
+
+def poll_job(operator, props, base_url, job_id, done_status):
+    # Poll until the job reaches done_status, returning its status payload
+    while True:
+        status_response = requests.get(f"{base_url}/status/{job_id}")
+        if status_response.status_code != 200:
+            operator.report({'ERROR'}, "Failed to check status")
+            return None
+        
+        status = status_response.json()
+        
+        if status["status"] == done_status:
+            return status
+        
+        elif status["status"] == "failed":
+            operator.report({'ERROR'}, f"Generation failed: {status.get('error', 'Unknown error')}")
+            return None
+        
+        props.status_message = status["status"].replace("_", " ").capitalize() + "..."
+        time.sleep(2)
+
 class TextTo3DProperties(bpy.types.PropertyGroup):
     prompt: StringProperty(
         name="Text Prompt",
@@ -52,6 +122,22 @@ class TextTo3DProperties(bpy.types.PropertyGroup):
         max=2048,
         step=512
     )
+    num_images: IntProperty(
+        name="Image Variants",
+        description="Number of seed variants to preview before generating the 3D model",
+        default=4,
+        min=1,
+        max=8
+    )
+    selected_image: EnumProperty(
+        name="Selected Image",
+        description="Image variant to send to the 3D stage",
+        items=get_preview_items
+    )
+    preview_job_id: StringProperty(
+        name="Preview Job ID",
+        default=""
+    )
     status_message: StringProperty(
         name="Status Message",
         default=""
@@ -112,43 +198,155 @@ class OBJECT_OT_generate_3d(bpy.types.Operator):
             job_id = result["job_id"]
             props.job_id = job_id
             
-            # Poll for completion
-            while True:
-                status_response = requests.get(f"{base_url}/status/{job_id}")
-                if status_response.status_code != 200:
-                    self.report({'ERROR'}, "Failed to check status")
-                    break
-                
-                status = status_response.json()
-                
-                if status["status"] == "completed":
-                    # Get the base64 model data
-                    model_base64 = status.get("model_base64")
-                    if not model_base64:
-                        self.report({'ERROR'}, "No model data received")
-                        break
-                    
-                    # Decode base64 and save to temporary file
-                    model_data = base64.b64decode(model_base64)
-                    temp_file = tempfile.NamedTemporaryFile(delete=False, suffix=".glb")
-                    temp_file.write(model_data)
-                    temp_file.close()
-                    
-                    # Import the GLB file in the main thread
-                    def import_handler():
-                        bpy.ops.import_scene.gltf(filepath=temp_file.name)
-                        os.unlink(temp_file.name)
-                        props.is_processing = False
-                        return None
-                    
-                    bpy.app.timers.register(import_handler)
-                    break
+            status = poll_job(self, props, base_url, job_id, "completed")
+            if status is None:
+                return
+            
+            # Get the base64 model data
+            model_base64 = status.get("model_base64")
+            if not model_base64:
+                self.report({'ERROR'}, "No model data received")
+                return
+            
+            import_model(props, model_base64)
                 
-                elif status["status"] == "failed":
-                    self.report({'ERROR'}, f"Generation failed: {status.get('error', 'Unknown error')}")
-                    break
+        except Exception as e:
+            self.report({'ERROR'}, f"Error: {str(e)}")
+        
+        finally:
+            props.is_processing = False
+
+class OBJECT_OT_generate_previews(bpy.types.Operator):
+    bl_idname = "object.generate_3d_previews"
+    bl_label = "Preview Images"
+    bl_description = "Generate image variants to pick from before running the 3D stage"
+    
+    def execute(self, context):
+        props = context.scene.text_to_3d_props
+        
+        if not props.prompt:
+            self.report({'ERROR'}, "Please enter a text prompt")
+            return {'CANCELLED'}
+        
+        props.is_processing = True
+        threading.Thread(target=self.generate_previews, args=(context,)).start()
+        
+        return {'FINISHED'}
+    
+    def generate_previews(self, context):
+        props = context.scene.text_to_3d_props
+        base_url = props.api_url.rstrip('/')
+        
+        try:
+            try:
+                response = requests.post(
+                    f"{base_url}/images",
+                    json={
+                        "prompt": props.prompt,
+                        "num_images": props.num_images,
+                        "height": 1024,
+                        "width": 1024,
+                        "steps": 8,
+                        "scales": 3.5
+                    },
+                    headers={
+                        "Authorization": f"Bearer {props.api_key}"
+                    }
+                )
+            except requests.exceptions.ConnectionError:
+                self.report({'ERROR'}, "Could not connect to the server. Please make sure the server is running and the API URL is correct.")
+                return
+            
+            if response.status_code != 200:
+                self.report({'ERROR'}, f"Image generation failed: {response.text}")
+                return
+            
+            job_id = response.json()["job_id"]
+            
+            status = poll_job(self, props, base_url, job_id, "images_ready")
+            if status is None:
+                return
+            
+            images = status.get("images") or []
+            if not images:
+                self.report({'ERROR'}, "No images received")
+                return
+            
+            def preview_handler():
+                load_previews(images)
+                props.preview_job_id = job_id
+                props.selected_image = images[0]["image_id"]
+                return None
+            
+            bpy.app.timers.register(preview_handler)
                 
-                time.sleep(2)
+        except Exception as e:
+            self.report({'ERROR'}, f"Error: {str(e)}")
+        
+        finally:
+            props.is_processing = False
+
+class OBJECT_OT_generate_3d_from_selected(bpy.types.Operator):
+    bl_idname = "object.generate_3d_from_selected"
+    bl_label = "Generate 3D from Selected"
+    bl_description = "Generate a 3D model from the selected image variant"
+    
+    @classmethod
+    def poll(cls, context):
+        props = context.scene.text_to_3d_props
+        return bool(props.preview_job_id) and not props.is_processing
+    
+    def execute(self, context):
+        props = context.scene.text_to_3d_props
+        
+        if not props.selected_image:
+            self.report({'ERROR'}, "Please select an image")
+            return {'CANCELLED'}
+        
+        props.is_processing = True
+        threading.Thread(target=self.generate_model, args=(context,)).start()
+        
+        return {'FINISHED'}
+    
+    def generate_model(self, context):
+        props = context.scene.text_to_3d_props
+        base_url = props.api_url.rstrip('/')
+        job_id = props.preview_job_id
+        
+        try:
+            try:
+                response = requests.post(
+                    f"{base_url}/generate-3d",
+                    json={
+                        "job_id": job_id,
+                        "image_id": props.selected_image,
+                        "mesh_simplify": props.mesh_simplify,
+                        "texture_size": props.texture_size
+                    },
+                    headers={
+                        "Authorization": f"Bearer {props.api_key}"
+                    }
+                )
+            except requests.exceptions.ConnectionError:
+                self.report({'ERROR'}, "Could not connect to the server. Please make sure the server is running and the API URL is correct.")
+                return
+            
+            if response.status_code != 200:
+                self.report({'ERROR'}, f"Generation failed: {response.text}")
+                return
+            
+            props.job_id = job_id
+            
+            status = poll_job(self, props, base_url, job_id, "completed")
+            if status is None:
+                return
+            
+            model_base64 = status.get("model_base64")
+            if not model_base64:
+                self.report({'ERROR'}, "No model data received")
+                return
+            
+            import_model(props, model_base64)
                 
         except Exception as e:
             self.report({'ERROR'}, f"Error: {str(e)}")
@@ -178,16 +376,33 @@ class VIEW3D_PT_text_to_3d(bpy.types.Panel):
         row.enabled = not props.is_processing
         row.operator("object.generate_3d")
         
+        # Pick an image variant before spending time on the 3D stage
+        box = layout.box()
+        box.prop(props, "num_images")
+        row = box.row()
+        row.enabled = not props.is_processing
+        row.operator("object.generate_3d_previews")
+        if props.preview_job_id:
+            box.template_icon_view(props, "selected_image", show_labels=True, scale=6.0)
+            box.operator("object.generate_3d_from_selected")
+        
         if props.is_processing:
             layout.label(text=props.status_message or "Processing...")
 
 classes = (
     TextTo3DProperties,
     OBJECT_OT_generate_3d,
+    OBJECT_OT_generate_previews,
+    OBJECT_OT_generate_3d_from_selected,
     VIEW3D_PT_text_to_3d,
 )
 
 def register():
+    pcoll = bpy.utils.previews.new()
+    pcoll.enum_items = []
+    pcoll.temp_files = []
+    preview_collections["main"] = pcoll
+    
     for cls in classes:
         bpy.utils.register_class(cls)
     bpy.types.Scene.text_to_3d_props = bpy.props.PointerProperty(type=TextTo3DProperties)
@@ -196,6 +411,11 @@ def unregister():
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
     del bpy.types.Scene.text_to_3d_props
+    
+    clear_previews()
+    for pcoll in preview_collections.values():
+        bpy.utils.previews.remove(pcoll)
+    preview_collections.clear()
 
 if __name__ == "__main__":
     register()
\ No newline at end of file